@@ -0,0 +1,74 @@
+"""Custom response classes"""
+
+import os
+import stat
+from typing import Optional
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+# ASGI extensions that let the server write the body itself with sendfile()
+PATHSEND = "http.response.pathsend"
+ZEROCOPYSEND = "http.response.zerocopysend"
+
+
+class ZeroCopyFileResponse(FileResponse):
+    """FileResponse that lets the server send the body with sendfile()
+
+    When the ASGI server advertises ``http.response.pathsend`` (or
+    ``http.response.zerocopysend``) the file path (or open file) is handed
+    over after ``http.response.start`` and the kernel copies it straight to
+    the socket. Otherwise we fall back to Starlette's chunked send with 1 MiB
+    reads instead of the 64 KiB default.
+    """
+
+    chunk_size = 1 << 20
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        extension = self._zerocopy_extension(scope)
+        if extension is None:
+            await super().__call__(scope, receive, send)
+            return
+
+        # Same checks as FileResponse: the server gets the path as-is, so a
+        # directory or a vanished file must fail here, before the headers go out
+        if self.stat_result is None:
+            try:
+                stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+            except FileNotFoundError:
+                raise RuntimeError(f"File at path {self.path} does not exist.")
+            if not stat.S_ISREG(stat_result.st_mode):
+                raise RuntimeError(f"File at path {self.path} is not a file.")
+            self.set_stat_headers(stat_result)
+
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if extension == PATHSEND:
+            await send({"type": PATHSEND, "path": os.path.abspath(self.path)})
+        else:
+            file = await anyio.to_thread.run_sync(open, self.path, "rb")
+            try:
+                await send({"type": ZEROCOPYSEND, "file": file})
+            finally:
+                file.close()
+
+        if self.background is not None:
+            await self.background()
+
+    def _zerocopy_extension(self, scope: Scope) -> Optional[str]:
+        """Pick the zero-copy extension to use; only plain full-body GETs qualify"""
+        if scope["type"] != "http" or self.status_code != 200:
+            return None
+        if scope["method"].upper() == "HEAD" or "range" in Headers(scope=scope):
+            return None
+        extensions = scope.get("extensions") or {}
+        if PATHSEND in extensions:
+            return PATHSEND
+        if ZEROCOPYSEND in extensions:
+            return ZEROCOPYSEND
+        return None
@@ -1,31 +1,120 @@
 """API route definitions"""
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, WebSocket
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect, Header, Depends
+from starlette.requests import HTTPConnection
 import os
 import asyncio
 import logging
+import secrets
+import orjson
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
 
+from app.api.responses import ZeroCopyFileResponse
 from app.services.video_service import VideoService
-from app.models.schemas import VideoProcessRequest, VideoEnhancementRequest, InstructionRequest
+from app.models.schemas import (
+    VideoEnhancementRequest, InstructionRequest, HealthResponse, UploadResponse,
+    EditResponse, EnhancementResponse, ReloadSettingsResponse,
+)
 from app.config import get_settings
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1", tags=["video-operations"])
 
-# Lazy initialize the AI Service
-_video_service = None
+WS_HEARTBEAT_SECONDS = 30.0
 
-def get_video_service():
-    """Lazy load VideoService to ensure environment variables are loaded"""
-    global _video_service
-    if _video_service is None:
-        _video_service = VideoService()
-    return _video_service
+# Hot settings bound once at import; /admin/reload-settings rebinds them
+_settings = get_settings()
+TEMP_DIR = _settings.temp_video_dir
+OUT_DIR = _settings.output_video_dir
 
 
-@router.get("/health")
+def _bind_settings():
+    global _settings, TEMP_DIR, OUT_DIR
+    _settings = get_settings()
+    TEMP_DIR = _settings.temp_video_dir
+    OUT_DIR = _settings.output_video_dir
+
+_ALLOWED_UPLOAD_TYPES = frozenset({
+    "video/mp4",
+    "video/mpeg",
+    "video/quicktime",
+    "video/x-msvideo",
+    "application/octet-stream",
+})
+
+async def get_video_service(conn: HTTPConnection) -> VideoService:
+    """Dependency returning the app-wide VideoService created in `lifespan`.
+
+    Falls back to creating it on first use if startup could not (e.g. the
+    Gemini key was only configured afterwards).
+    """
+    service = getattr(conn.app.state, "video_service", None)
+    if service is None:
+        try:
+            service = await VideoService.create()
+        except ValueError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        # Another request may have finished creating it while this one waited
+        service = getattr(conn.app.state, "video_service", None) or service
+        conn.app.state.video_service = service
+    return service
+
+
+# Backpressure for editing jobs: at most `max_concurrent_jobs` run at once and
+# at most `max_queued_jobs` may be waiting or running before we shed load.
+_job_slots = asyncio.Semaphore(_settings.max_concurrent_jobs)
+_pending_jobs = 0
+
+
+@asynccontextmanager
+async def _job_slot():
+    """Wait for an editing slot, or fail fast with 503 when the backlog is full"""
+    global _pending_jobs
+    if _pending_jobs >= _settings.max_queued_jobs:
+        raise HTTPException(status_code=503, detail="Too many editing jobs in progress, please retry later.")
+    _pending_jobs += 1
+    try:
+        async with _job_slots:
+            yield
+    finally:
+        _pending_jobs -= 1
+
+
+# Edits currently running, keyed by (video_path, instruction). Identical
+# concurrent requests share one job instead of encoding the video twice.
+_inflight_jobs: Dict[Tuple[str, str], "asyncio.Task[Dict[str, Any]]"] = {}
+
+
+def get_optional_video_service(conn: HTTPConnection) -> Optional[VideoService]:
+    """Dependency returning the VideoService if one exists, without creating it"""
+    return getattr(conn.app.state, "video_service", None)
+
+
+async def _edit_job(service: VideoService, video_path: str, instruction: str) -> Dict[str, Any]:
+    async with _job_slot():
+        return await service.edit_video_by_instruction(video_path, instruction)
+
+
+async def _run_edit(service: VideoService, video_path: str, instruction: str) -> Dict[str, Any]:
+    """Run an edit, joining an identical one that is already in flight"""
+    key = (video_path, instruction)
+    task = _inflight_jobs.get(key)
+    if task is None:
+        task = asyncio.create_task(_edit_job(service, video_path, instruction))
+        _inflight_jobs[key] = task
+        task.add_done_callback(lambda _: _inflight_jobs.pop(key, None))
+    # Shield so one client disconnecting doesn't cancel the job for the others
+    return await asyncio.shield(task)
+
+
+async def _exists(path: str) -> bool:
+    """Check a path off the event loop so a slow stat doesn't stall other requests"""
+    return await asyncio.to_thread(os.path.exists, path)
+
+
+@router.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
     return {
@@ -35,18 +124,16 @@ async def health_check():
     }
 
 
-@router.post("/upload/video")
-async def upload_video(file: UploadFile = File(...)):
+@router.post("/upload/video", response_model=UploadResponse)
+async def upload_video(file: UploadFile = File(...), service: VideoService = Depends(get_video_service)):
     """Upload a video file"""
     try:
         # Validate file type
-        allowed_types = ["video/mp4", "video/mpeg", "video/quicktime", "video/x-msvideo", "application/octet-stream"]
-        if file.content_type not in allowed_types:
+        if file.content_type not in _ALLOWED_UPLOAD_TYPES:
             # Log warning but allow for now if needed, or stricter check
             pass
 
-        settings = get_settings()
-        file_path = await get_video_service().save_upload(file, settings.temp_video_dir)
+        file_path = await service.save_upload(file, TEMP_DIR)
         video_id = os.path.basename(file_path)
 
         return {
@@ -60,60 +147,100 @@ async def upload_video(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/instruct")
-async def instruct(request: InstructionRequest):
+@router.post("/instruct", response_model=EditResponse)
+async def instruct(request: InstructionRequest, service: VideoService = Depends(get_video_service)):
     """
     Accept a natural-language instruction, interpret it using Gemini, and execute edits.
     Waits for completion to return the output path directly.
     """
     try:
-        settings = get_settings()
-        video_path = os.path.join(settings.temp_video_dir, request.video_id)
+        video_path = os.path.join(TEMP_DIR, request.video_id)
         
-        if not os.path.exists(video_path):
+        if not await _exists(video_path):
              raise HTTPException(status_code=404, detail=f"Video {request.video_id} not found in temp storage.")
 
         # Call the new AI-driven method in video_service
         # This will block until processing is done (good for demo, use BackgroundTasks for production)
-        result = await get_video_service().edit_video_by_instruction(video_path, request.instruction)
+        result = await _run_edit(service, video_path, request.instruction)
         
         if result.get("status") == "error":
             raise HTTPException(status_code=500, detail=result.get("message"))
 
         return result
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/download/{filename}")
-async def download_video(filename: str):
-    """Download processed video"""
-    settings = get_settings()
-    out_dir = settings.output_video_dir
-    file_path = os.path.join(out_dir, filename)
+async def download_video(filename: str, service: Optional[VideoService] = Depends(get_optional_video_service)):
+    """Download processed video (by output filename or by the uploaded video_id)"""
+    if service is not None:
+        filename = service.output_index.get(filename, filename)
+    file_path = os.path.join(OUT_DIR, filename)
 
-    if not os.path.exists(file_path):
+    if not await _exists(file_path):
         raise HTTPException(status_code=404, detail="Video file not found")
 
-    return FileResponse(
+    return ZeroCopyFileResponse(
         path=file_path,
         filename=filename,
         media_type="video/mp4"
     )
 
+@router.websocket("/ws/progress/{video_id}")
+async def ws_progress(websocket: WebSocket, video_id: str, service: VideoService = Depends(get_video_service)):
+    """Push the processing status of a video whenever it changes"""
+    await websocket.accept()
+    try:
+        while True:
+            # Grab the event before reading the status so no transition is missed
+            changed = service.status_changed(video_id)
+            status = await service.get_status(video_id)
+            await websocket.send_text(orjson.dumps({"video_id": video_id, "status": status}).decode())
+            if status in ("completed", "failed"):
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=WS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                pass  # resend the current status as a heartbeat
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+@router.post("/admin/reload-settings", response_model=ReloadSettingsResponse)
+async def reload_settings(authorization: Optional[str] = Header(None)):
+    """Re-read settings from the environment and rebind the cached route settings.
+
+    Job concurrency limits are fixed at startup and need a restart to change.
+    Disabled unless API_KEY is set.
+    """
+    if not _settings.api_key:
+        raise HTTPException(status_code=403, detail="Admin endpoints require API_KEY to be configured")
+    if not secrets.compare_digest(authorization or "", f"Bearer {_settings.api_key}"):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+    get_settings.cache_clear()
+    _bind_settings()
+    return {"status": "success", "temp_video_dir": TEMP_DIR, "output_video_dir": OUT_DIR}
+
 # --- Legacy Endpoints (Optional / Backward Compatibility) ---
 
-@router.post("/enhance/video")
-async def enhance_video(request: VideoEnhancementRequest):
+@router.post("/enhance/video", response_model=EnhancementResponse)
+async def enhance_video(request: VideoEnhancementRequest, service: VideoService = Depends(get_video_service)):
     """Legacy endpoint wrapper for AI enhancement"""
     try:
-        settings = get_settings()
-        video_path = os.path.join(settings.temp_video_dir, request.video_id)
-        if not os.path.exists(video_path):
+        video_path = os.path.join(TEMP_DIR, request.video_id)
+        if not await _exists(video_path):
             raise HTTPException(status_code=404, detail="Video not found")
 
-        result = await get_video_service().enhance_video(video_path, request.enhancement_type, request.settings)
+        result = await service.enhance_video(video_path, request.enhancement_type, request.settings)
+        if result.get("status") == "error":
+            raise HTTPException(status_code=500, detail=result.get("message"))
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,12 +1,21 @@
 """Application configuration"""
 
+import os
 from functools import lru_cache
-from typing import Optional
-from pydantic_settings import BaseSettings
+from typing import Any, Dict, Optional, Tuple
 
+import msgspec
+from dotenv import dotenv_values
 
-class Settings(BaseSettings):
-    """Application settings"""
+ENV_FILE = ".env"
+
+
+class Settings(msgspec.Struct, frozen=True):
+    """Application settings
+
+    Populated from environment variables (case-insensitive) with `.env` as a
+    lower-priority fallback, same precedence as pydantic-settings had.
+    """
 
     # API Configuration
     api_host: str = "0.0.0.0"
@@ -21,13 +30,20 @@ class Settings(BaseSettings):
     supported_formats: str = "mp4,avi,mov,mkv,flv"
     temp_video_dir: str = "./data/temp_videos"
     output_video_dir: str = "./data/output_videos"
+    output_index_file: str = "./data/output_index.json"  # video_id -> latest output, kept across restarts
     
     # Video Encoding (Memory Optimization)
-    video_preset: str = "medium"  # ultrafast, superfast, veryfast, faster, fast, medium, slow, slower
+    video_preset: str = "faster"  # ultrafast, superfast, veryfast, faster, fast, medium, slow, slower
     video_bitrate: str = "2000k"  # Lower bitrate = less RAM usage (e.g., "1500k", "2000k", "3000k")
     video_crf: int = 28  # Quality (0-51, default 23: lower=better, higher=faster/smaller)
+    encoder_threads: int = 0  # ffmpeg encoder threads; 0 = one per CPU core
     audio_chunk_duration: float = 5.0  # Process audio in chunks (seconds) to reduce RAM
 
+    # Job Scheduling
+    max_concurrent_jobs: int = 2  # Edits running at once; each holds a decoded video in RAM
+    max_queued_jobs: int = 32  # Edits allowed to wait for a slot before /instruct returns 503
+    max_tracked_statuses: int = 100_000  # Oldest video statuses are forgotten past this
+
     # Database
     database_url: str = "sqlite:///./data/filmy_ai.db"
 
@@ -49,13 +65,44 @@ class Settings(BaseSettings):
     log_level: str = "INFO"
     log_file: str = "./logs/app.log"
 
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
-        env_file_encoding = "utf-8-sig"
+    @property
+    def supported_formats_list(self) -> Tuple[str, ...]:
+        """Supported file extensions, normalised and in configured order"""
+        return _split_formats(self.supported_formats)
+
+
+@lru_cache(maxsize=8)
+def _split_formats(formats: str) -> Tuple[str, ...]:
+    return tuple(dict.fromkeys(f.strip().lower() for f in formats.split(",") if f.strip()))
+
+
+# msgspec only parses true/false/1/0; pydantic-settings also took these
+_BOOL_STRINGS = {
+    "yes": True, "y": True, "on": True, "t": True,
+    "no": False, "n": False, "off": False, "f": False,
+}
+_BOOL_FIELDS = frozenset(f.name for f in msgspec.structs.fields(Settings) if f.type is bool)
+
+
+def _read_env() -> Dict[str, Any]:
+    """Collect raw setting values from `.env` and the process environment"""
+    values = {}
+    if os.path.exists(ENV_FILE):
+        values.update(dotenv_values(ENV_FILE, encoding="utf-8-sig"))
+    values.update(os.environ)
+
+    fields = set(Settings.__struct_fields__)
+    settings = {
+        key.lower(): value
+        for key, value in values.items()
+        if value is not None and key.lower() in fields
+    }
+    for key in _BOOL_FIELDS & settings.keys():
+        settings[key] = _BOOL_STRINGS.get(settings[key].strip().lower(), settings[key])
+    return settings
 
 
 @lru_cache()
 def get_settings() -> Settings:
     """Get cached settings instance"""
-    return Settings()
+    return msgspec.convert(_read_env(), Settings, strict=False)
@@ -80,3 +80,54 @@ class InstructionRequest(BaseModel):
 class InstructionResponse(BaseModel):
     status: str = Field(...)
     operations: List[Operation] = Field(default_factory=list)
+
+
+class HealthResponse(BaseModel):
+    """Health check response"""
+    status: str
+    service: str
+    version: str
+
+
+class ServiceInfoResponse(BaseModel):
+    """Root endpoint response"""
+    service: str
+    version: str
+    status: str
+    docs: str
+
+
+class FeaturesResponse(BaseModel):
+    """Available enhancements, editing operations and upload formats"""
+    video_enhancements: List[str]
+    editing_operations: List[str]
+    supported_formats: List[str]
+
+
+class UploadResponse(BaseModel):
+    """Response for a stored upload"""
+    status: str
+    video_id: str = Field(..., description="ID to pass to the edit and enhance endpoints")
+    message: str
+    filename: str
+
+
+class EditResponse(BaseModel):
+    """Response for a finished instruction-driven edit"""
+    status: str
+    output_path: str
+    operations: Dict[str, Any] = Field(default_factory=dict, description="Edit commands that were applied")
+
+
+class EnhancementResponse(BaseModel):
+    """Response for a finished enhancement"""
+    status: str
+    output_path: str
+    enhancement_type: str
+
+
+class ReloadSettingsResponse(BaseModel):
+    """Response for a settings reload"""
+    status: str
+    temp_video_dir: str
+    output_video_dir: str
@@ -5,30 +5,88 @@ wrapper to eventually call Gemini. For now it uses a rule-based fallback if
 no `GEMINI_API_KEY` env var is present. Do NOT paste secrets into source;
 set `GEMINI_API_KEY` in your environment instead.
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set, Tuple
+from collections import OrderedDict
+import asyncio
 import os
 import logging
 import json
 import re
+import threading
+import weakref
+
+import httpx
 
 logger = logging.getLogger(__name__)
 
+GEMINI_ENDPOINT = "https://generativelanguage.googleapis.com/v1beta2/models/text-bison-001:generate"
+
+PARSE_CACHE_SIZE = 4096
+
+# Normalized instruction + key -> JSON-encoded operations, in LRU order.
+# Guarded by a lock because the app loop and the background loop share it.
+_parse_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_parse_cache_lock = threading.Lock()
+
+# Pooled clients so consecutive Gemini calls reuse the TCP/TLS connection.
+# An AsyncClient is bound to one event loop, so keep one per loop.
+_gemini_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+# Long-lived loop that synchronous callers submit parses to, so they don't
+# pay for a fresh event loop (and a fresh client) on every call.
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+# Every keyword the rule-based parser cares about, compiled into one
+# alternation so a single left-to-right scan finds all of them. Longer
+# keywords come first so "brightness" is not swallowed by "bright".
+_KEYWORD_RE = re.compile(
+    r"(?P<denoise>denoise|noise)"
+    r"|(?P<stabilize>stabil|steady)"
+    r"|(?P<brightness>brightness)"
+    r"|(?P<bright>bright)"
+    r"|(?P<color>color|contrast)"
+    r"|(?P<crop>crop|resize|aspect)"
+    r"|(?P<widescreen>16:9)"
+)
+
+
+def _ops(*types: str) -> str:
+    return json.dumps([{"type": t, "params": {}} for t in types])
+
+
+# Canonical one-verb instructions (mostly UI shortcuts) answered without
+# touching the cache, the keyword scan or Gemini. Values are JSON so each
+# caller gets its own copy.
+_FAST_PATHS = {
+    "": _ops("upscale"),
+    "upscale": _ops("upscale"),
+    "enhance": _ops("upscale"),
+    "denoise": _ops("denoise"),
+    "remove noise": _ops("denoise"),
+    "stabilize": _ops("stabilize"),
+    "stabilise": _ops("stabilize"),
+    "resize": _ops("resize"),
+    "crop 16:9": json.dumps([{"type": "crop", "params": {"aspect": "16:9"}}]),
+}
+
 
 def _rule_based_parse(instruction: str) -> List[Dict[str, Any]]:
     """Naive parser that maps keywords to operations for MVP."""
-    inst = instruction.lower()
+    hits = {m.lastgroup for m in _KEYWORD_RE.finditer(instruction.lower())}
     ops = []
-    if "denoise" in inst or "noise" in inst or "remove noise" in inst:
+    if "denoise" in hits:
         ops.append({"type": "denoise", "params": {}})
-    if "stabil" in inst or "steady" in inst:
+    if "stabilize" in hits:
         ops.append({"type": "stabilize", "params": {}})
-    if "brightness" in inst or "color" in inst or "contrast" in inst:
+    if hits & {"brightness", "color"}:
         params = {}
-        if "bright" in inst:
+        if hits & {"brightness", "bright"}:
             params["brightness"] = 0.1
         ops.append({"type": "color_adjust", "params": params})
-    if "crop" in inst or "resize" in inst or "aspect" in inst:
-        if "16:9" in inst:
+    if "crop" in hits:
+        if "widescreen" in hits:
             ops.append({"type": "crop", "params": {"aspect": "16:9"}})
         else:
             ops.append({"type": "resize", "params": {}})
@@ -37,68 +95,257 @@ def _rule_based_parse(instruction: str) -> List[Dict[str, Any]]:
     return ops
 
 
-def parse_instruction(instruction: str) -> List[Dict[str, Any]]:
+def _get_gemini_client() -> httpx.AsyncClient:
+    """Return the pooled Gemini client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _gemini_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=15,
+            limits=httpx.Limits(max_keepalive_connections=32),
+        )
+        _gemini_clients[loop] = client
+    return client
+
+
+async def close_gemini_client() -> None:
+    """Close the running loop's pooled Gemini client (call on application shutdown)"""
+    client = _gemini_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """Start (once) and return the daemon event loop used by sync callers"""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_background_loop.run_forever,
+                name="instruction-parser",
+                daemon=True,
+            ).start()
+    return _background_loop
+
+
+_OPERATIONS_PROMPT = (
+    "You are a service that converts a user's natural-language video-editing "
+    "instruction into a JSON array called operations. Each operation must be "
+    "an object with keys 'type' (string) and 'params' (object). "
+)
+_OPERATIONS_EXAMPLE = "[{\"type\":\"denoise\",\"params\":{}},{\"type\":\"crop\",\"params\":{\"aspect\":\"16:9\"}}]"
+
+
+_json_decoder = json.JSONDecoder()
+
+
+def _decode_embedded_json(text: str, opener: str) -> Any:
+    """Decode the first JSON value starting with `opener` inside model output.
+
+    Decodes in place from each candidate `opener` instead of regex-slicing
+    the text first; falls back to decoding the whole text.
+    """
+    start = text.find(opener)
+    while start >= 0:
+        try:
+            return _json_decoder.raw_decode(text, start)[0]
+        except json.JSONDecodeError:
+            start = text.find(opener, start + 1)
+    return json.loads(text)
+
+
+async def _gemini_generate(prompt: str, key: str) -> str:
+    """Send one prompt to Gemini and return the generated text"""
+    payload = {"prompt": {"text": prompt}, "temperature": 0}
+    resp = await _get_gemini_client().post(GEMINI_ENDPOINT, params={"key": key}, json=payload)
+    resp.raise_for_status()
+    data = resp.json()
+
+    # Extract textual output from known response fields
+    text = ""
+    if isinstance(data, dict):
+        # try common places
+        if "candidates" in data and isinstance(data["candidates"], list) and data["candidates"]:
+            cand = data["candidates"][0]
+            if isinstance(cand, dict):
+                text = cand.get("content") or cand.get("output") or cand.get("text") or ""
+        if not text:
+            text = data.get("output") or data.get("content") or ""
+
+    if not text:
+        # as last resort, stringify response
+        text = json.dumps(data)
+    return text
+
+
+async def _gemini_parse(instruction: str, key: str) -> List[Dict[str, Any]]:
+    """Ask Gemini to convert the instruction into operations.
+
+    Raises on any network or parsing failure so the caller can fall back.
+    """
+    prompt = (
+        _OPERATIONS_PROMPT + "Only output the JSON array. Example: " + _OPERATIONS_EXAMPLE
+        + "\n\nInstruction:\n" + instruction + "\n\n"
+    )
+    text = await _gemini_generate(prompt, key)
+
+    ops = _decode_embedded_json(text, "[")
+    if not isinstance(ops, list):
+        raise ValueError("Gemini returned non-list")
+    return ops
+
+
+async def _gemini_parse_batch(instructions: List[str], key: str) -> Dict[str, Any]:
+    """Convert several instructions in one Gemini call.
+
+    Returns the decoded object mapping each instruction's index (as a string)
+    to its operations array; entries may be missing or malformed.
+    """
+    listing = "\n".join(json.dumps({"id": i, "text": text}) for i, text in enumerate(instructions))
+    prompt = (
+        _OPERATIONS_PROMPT + "You will receive several instructions, one JSON object per "
+        "line with keys 'id' and 'text'. Only output a single JSON object mapping each "
+        "id (as a string) to its operations array. Example: {\"0\": " + _OPERATIONS_EXAMPLE + "}"
+        "\n\nInstructions:\n" + listing + "\n\n"
+    )
+    text = await _gemini_generate(prompt, key)
+
+    results = _decode_embedded_json(text, "{")
+    if not isinstance(results, dict):
+        raise ValueError("Gemini returned non-object for batch")
+    return results
+
+
+class GeminiBatcher:
+    """Coalesces concurrent Gemini parses into batched API calls.
+
+    Instructions submitted within `window` seconds of each other are sent as
+    one request (up to `max_batch` per request), so a burst of /instruct
+    traffic pays one round trip instead of one per caller. A lone
+    instruction still goes out on its own with the single-instruction prompt.
+    """
+
+    def __init__(self, window: float = 0.01, max_batch: int = 16):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks; hold in-flight sends here
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, instruction: str, key: str) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((instruction, key, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush_now)
+        return await future
+
+    def _flush_now(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        by_key: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        for instruction, key, future in pending:
+            by_key.setdefault(key, []).append((instruction, future))
+        for key, items in by_key.items():
+            for start in range(0, len(items), self.max_batch):
+                task = asyncio.ensure_future(self._send(items[start:start + self.max_batch], key))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, items: List[Tuple[str, asyncio.Future]], key: str):
+        # Identical instructions in the same window share one slot in the prompt
+        unique = list(dict.fromkeys(instruction for instruction, _ in items))
+        try:
+            if len(unique) == 1:
+                ops = await _gemini_parse(unique[0], key)
+                results = {"0": ops}
+            else:
+                results = await _gemini_parse_batch(unique, key)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for instruction, future in items:
+            if future.done():
+                continue
+            ops = results.get(str(unique.index(instruction)))
+            if isinstance(ops, list):
+                future.set_result(ops)
+            else:
+                future.set_exception(ValueError("Gemini returned no operations for instruction"))
+
+
+# Batchers hold loop-bound futures and timers, so keep one per event loop
+_gemini_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, GeminiBatcher]" = weakref.WeakKeyDictionary()
+
+
+def _get_gemini_batcher() -> GeminiBatcher:
+    loop = asyncio.get_running_loop()
+    batcher = _gemini_batchers.get(loop)
+    if batcher is None:
+        batcher = _gemini_batchers[loop] = GeminiBatcher()
+    return batcher
+
+
+async def _parse_cached(instruction: str, key: Optional[str]) -> str:
+    """Memoized parse of a normalized instruction.
+
+    Results are stored as a JSON string so cached entries stay immutable.
+    Gemini failures raise and are therefore never cached.
+    """
+    cache_key = (instruction, key)
+    with _parse_cache_lock:
+        cached = _parse_cache.get(cache_key)
+        if cached is not None:
+            _parse_cache.move_to_end(cache_key)
+            return cached
+
+    if not key:
+        ops_json = json.dumps(_rule_based_parse(instruction))
+    else:
+        ops_json = json.dumps(await _get_gemini_batcher().submit(instruction, key))
+
+    with _parse_cache_lock:
+        _parse_cache[cache_key] = ops_json
+        if len(_parse_cache) > PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+    return ops_json
+
+
+async def parse_instruction(instruction: str) -> List[Dict[str, Any]]:
     """Parse the user's instruction into a list of operations.
 
     If `GEMINI_API_KEY` is set this will attempt to call Google's Generative
     Language API (text-bison) to convert the instruction into a JSON array of
     operations. If the call fails or the response cannot be parsed, it falls
     back to the internal rule-based parser.
+
+    Parses are cached per normalized (stripped, lowercased) instruction, so
+    repeated instructions skip the network round trip entirely.
     """
-    key = os.environ.get("GEMINI_API_KEY")
-    if not key:
-        return _rule_based_parse(instruction)
+    normalized = instruction.strip().lower()
+    fast = _FAST_PATHS.get(normalized.rstrip(".!"))
+    if fast is not None:
+        return json.loads(fast)
 
-    # Try to call Google's Generative Language API (Generative AI) with API key.
+    key = os.environ.get("GEMINI_API_KEY")
     try:
-        try:
-            import requests
-        except Exception:
-            logger.warning("'requests' not available; falling back to rule-based parser")
-            return _rule_based_parse(instruction)
-
-        endpoint = f"https://generativelanguage.googleapis.com/v1beta2/models/text-bison-001:generate?key={key}"
-        prompt = (
-            "You are a service that converts a user's natural-language video-editing "
-            "instruction into a JSON array called operations. Each operation must be "
-            "an object with keys 'type' (string) and 'params' (object). Only output "
-            "the JSON array. Example: [{\"type\":\"denoise\",\"params\":{}},{\"type\":\"crop\",\"params\":{\"aspect\":\"16:9\"}}]"
-            "\n\nInstruction:\n" + instruction + "\n\n"
-        )
-
-        payload = {"prompt": {"text": prompt}, "temperature": 0}
-        resp = requests.post(endpoint, json=payload, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
-
-        # Extract textual output from known response fields
-        text = ""
-        if isinstance(data, dict):
-            # try common places
-            if "candidates" in data and isinstance(data["candidates"], list) and data["candidates"]:
-                cand = data["candidates"][0]
-                if isinstance(cand, dict):
-                    text = cand.get("content") or cand.get("output") or cand.get("text") or ""
-            if not text:
-                text = data.get("output") or data.get("content") or ""
-
-        if not text:
-            # as last resort, stringify response
-            text = json.dumps(data)
-
-        # Try to extract JSON array from the text
-        m = re.search(r"(\[.*\])", text, re.S)
-        ops_json = m.group(1) if m else text
-
-        ops = json.loads(ops_json)
-        if isinstance(ops, list):
-            return ops
-        else:
-            logger.warning("Gemini returned non-list, falling back to rule-based parser")
+        return json.loads(await _parse_cached(normalized, key))
     except Exception as e:
         logger.warning("Gemini call or parsing failed; falling back to rule-based parser: %s", e)
 
-    return _rule_based_parse(instruction)
+    return _rule_based_parse(normalized)
 
 
 def interpret_and_enqueue(video_id: str, instruction: str, processor_callable):
@@ -106,8 +353,11 @@ def interpret_and_enqueue(video_id: str, instruction: str, processor_callable):
 
     `processor_callable` should be a callable accepting `(video_id, operations)`.
     This keeps integration flexible (FastAPI background task or queue worker).
+    Safe to call from synchronous code or worker threads: the parse runs on a
+    shared background event loop.
     """
-    operations = parse_instruction(instruction)
+    future = asyncio.run_coroutine_threadsafe(parse_instruction(instruction), _get_background_loop())
+    operations = future.result()
     # In production, validate operations against an allowlist here.
     processor_callable(video_id, operations)
     return operations
@@ -1,13 +1,30 @@
 import os
 import json
+import hashlib
+import asyncio
 import logging
 import re
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+import weakref
+import orjson
+import aiofiles
 import numpy as np
 import noisereduce as nr
 import google.generativeai as genai
-from typing import Dict, Any
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
 from fastapi import UploadFile
-from datetime import datetime
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import cv2
+except ImportError:  # e.g. slim installs without OpenCV; grayscale falls back to NumPy
+    cv2 = None
 
 # --- UNIVERSAL MOVIEPY LOADER ---
 try:
@@ -21,35 +38,517 @@ except ImportError:
     import moviepy.video.fx as vfx
     logger_name = "MoviePy v2"
 
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+# v1 uses set_*/subclip/fl_image, v2 renamed them to with_*/subclipped/
+# image_transform; pick the names once instead of per call
+_SUBCLIP = "subclipped" if hasattr(VideoFileClip, "subclipped") else "subclip"
+_IMAGE_TRANSFORM = "image_transform" if hasattr(VideoFileClip, "image_transform") else "fl_image"
+_WITH_DURATION = "with_duration" if hasattr(ImageClip, "with_duration") else "set_duration"
+_WITH_START = "with_start" if hasattr(ImageClip, "with_start") else "set_start"
+_WITH_POSITION = "with_position" if hasattr(ImageClip, "with_position") else "set_position"
+
+# Speed effect: v1 exposes vfx.speedx via clip.fx, v2 the MultiplySpeed effect class
+if hasattr(vfx, "speedx"):
+    _FX_SPEED = lambda clip, factor: clip.fx(vfx.speedx, factor)
+elif hasattr(vfx, "MultiplySpeed"):
+    _FX_SPEED = lambda clip, factor: clip.with_effects([vfx.MultiplySpeed(factor)])
+else:
+    _FX_SPEED = None
+
 from app.config import get_settings
+from app.models.schemas import VideoMetadata
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 1 << 20
+INSTRUCTION_CACHE_SIZE = 1024
+
+# Text overlay position -> (x, y) for a clip of size (cw, ch) and overlay of size (iw, ih)
+_TEXT_POSITIONS = {
+    "center": lambda cw, ch, iw, ih: ((cw - iw) / 2, (ch - ih) / 2),
+    "top-left": lambda cw, ch, iw, ih: (20, 20),
+    "top-right": lambda cw, ch, iw, ih: (max(0, cw - iw - 20), 20),
+    "bottom-left": lambda cw, ch, iw, ih: (20, max(0, ch - ih - 20)),
+    "bottom-right": lambda cw, ch, iw, ih: (max(0, cw - iw - 20), max(0, ch - ih - 20)),
+}
+
+# Enhancement type -> ffmpeg video filter, scaled by intensity (0-1)
+_ENHANCEMENT_FILTERS = {
+    "upscale": lambda i: "scale=iw*2:ih*2:flags=lanczos",
+    "super_resolution": lambda i: f"scale=iw*2:ih*2:flags=lanczos,unsharp=5:5:{0.5 + i:.2f}",
+    "denoise": lambda i: f"hqdn3d={1 + 6 * i:.2f}",
+    "color_correction": lambda i: f"eq=contrast={1 + 0.3 * i:.2f}:saturation={1 + 0.5 * i:.2f}",
+    "stabilization": lambda i: "deshake",
+    "motion_blur_removal": lambda i: f"unsharp=5:5:{1.5 * i:.2f}",
+}
+
+
+# Hardware H.264 encoders in order of preference -> (preset, rate-control args
+# for a CRF-like quality). The preset is kept separate because MoviePy always
+# emits its own -preset.
+_HW_ENCODERS = {
+    "h264_nvenc": ("p1", lambda crf: ["-tune", "ll", "-rc", "vbr", "-cq", str(crf)]),
+    "h264_qsv": ("veryfast", lambda crf: ["-global_quality", str(crf)]),
+}
+
+
+@lru_cache(maxsize=1)
+def _detect_hw_encoder() -> Optional[str]:
+    """First hardware encoder that ffmpeg both lists and can actually open"""
+    try:
+        listed = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            capture_output=True, text=True, timeout=10,
+        ).stdout
+        for codec in _HW_ENCODERS:
+            if codec not in listed:
+                continue
+            # Being compiled in doesn't mean a device is present; try one frame
+            probe = subprocess.run(
+                ["ffmpeg", "-hide_banner", "-loglevel", "error",
+                 "-f", "lavfi", "-i", "color=size=256x256:duration=0.1",
+                 "-frames:v", "1", "-c:v", codec, "-f", "null", "-"],
+                capture_output=True, timeout=20,
+            )
+            if probe.returncode == 0:
+                return codec
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Hardware encoder probe failed: {e}")
+    return None
+
+
+# Prompts like "make it black and white" are answered locally instead of
+# with a Gemini round trip. Only short prompts that start with a plain verb
+# and contain nothing but known keywords and filler words qualify. The verb
+# decides which keywords are allowed: "remove the black and white filter"
+# means the opposite of "make it black and white", so removal verbs only
+# short-circuit for noise and anything else goes to the model.
+_ADDITIVE_PROMPT_RE = re.compile(r"^(?:please\s+)?(?:make|apply|convert|turn)\b")
+_DENOISE_PROMPT_RE = re.compile(
+    r"^(?:please\s+)?(?:(?:remove|reduce)\s+(?:the\s+)?(?:(?:background|audio)\s+)?noise|denoise)\b"
+)
+_PROMPT_KEYWORD_RE = re.compile(
+    r"\b(?:(?P<grayscale>black\s*(?:and|&)\s*white|gr[ae]yscale|monochrome|b&w)"
+    r"|(?P<denoise>denoise)|(?P<noise>noise))\b"
+)
+_PROMPT_COMMANDS = {"grayscale": "grayscale", "denoise": "remove_noise", "noise": "remove_noise"}
+_PROMPT_FILLER = frozenset({
+    "please", "it", "the", "this", "my", "video", "clip", "a", "an", "to", "into",
+    "and", "from", "filter", "effect", "background", "audio", "sound", "all",
+})
+
+
+def _keyword_parse(prompt: str) -> Dict[str, Any]:
+    """Commands for a trivial prompt, or {} if it needs the model"""
+    text = prompt.strip().lower().rstrip(".!")
+    if len(text) >= 60:
+        return {}
+    if m := _DENOISE_PROMPT_RE.match(text):
+        allowed = {"denoise", "noise"}
+    elif m := _ADDITIVE_PROMPT_RE.match(text):
+        allowed = {"grayscale", "denoise"}
+    else:
+        return {}
+    found = {k.lastgroup for k in _PROMPT_KEYWORD_RE.finditer(text)}
+    if not found or found - allowed:
+        return {}
+    rest = _PROMPT_KEYWORD_RE.sub(" ", text[m.end():])
+    if set(re.findall(r"[a-z&]+", rest)) - _PROMPT_FILLER:
+        return {}
+    return {_PROMPT_COMMANDS[k]: True for k in found}
+
+
+def _float_command(commands: Dict[str, Any], key: str, default: float) -> float:
+    try:
+        return float(commands.get(key, default))
+    except (ValueError, TypeError):
+        logger.warning(f"Invalid {key} value: {commands.get(key)}")
+        return default
+
+
+def _atempo_chain(speed: float) -> List[str]:
+    """Split a tempo factor into atempo stages that stay within 0.5-2.0"""
+    stages = []
+    while speed > 2.0:
+        stages.append("atempo=2.0")
+        speed /= 2.0
+    while speed < 0.5:
+        stages.append("atempo=0.5")
+        speed /= 0.5
+    stages.append(f"atempo={speed:.6g}")
+    return stages
+
+
+# Video codecs the MP4 muxer accepts as-is, so audio-only edits can stream-copy them
+_MP4_VIDEO_CODECS = frozenset({"h264", "hevc", "av1", "vp9", "mpeg4"})
+
+
+def _build_filter_graph(
+    commands: Dict[str, Any], duration: float, fps: Optional[float] = None
+) -> Tuple[List[str], List[str], List[str]]:
+    """Translate AI edit commands into ffmpeg input seek args plus video and audio filter chains"""
+    seek_args, video_filters, audio_filters = [], [], []
+
+    # --- TRIMMING ---
+    # Input-side seeking jumps to the nearest keyframe before `start` instead
+    # of decoding (and then discarding) everything in front of it
+    if commands.get("trim_start") or commands.get("trim_end"):
+        start = _float_command(commands, "trim_start", 0.0)
+        end = duration - _float_command(commands, "trim_end", 0.0)
+        seek_args = ["-ss", f"{start}", "-t", f"{max(0.0, end - start)}"]
+
+    # --- AUDIO ---
+    if commands.get("remove_noise"):
+        # Native FFT denoiser; streams in bounded memory unlike noisereduce
+        audio_filters.append("afftdn=nr=12:nf=-25")
+
+    boost = _float_command(commands, "volume_boost", 1.0)
+    if boost != 1.0:
+        audio_filters.append(f"volume={boost}")
+
+    # --- VISUALS ---
+    if commands.get("grayscale"):
+        video_filters.append("hue=s=0")
+
+    speed = _float_command(commands, "speed", 1.0)
+    if speed > 0 and speed != 1.0:
+        video_filters.append(f"setpts=PTS/{speed}")
+        # Retimed frames have no rate of their own; without this the output
+        # falls back to ffmpeg's default 25 fps instead of the source rate
+        if fps:
+            video_filters.append(f"fps={fps}")
+        audio_filters += _atempo_chain(speed)
+
+    return seek_args, video_filters, audio_filters
+
+
+def _extract_json(text: str) -> str:
+    """Slice the first balanced {...} object out of model output.
+
+    A single left-to-right scan tracking brace depth; braces inside JSON
+    strings are skipped. Returns the text unchanged if no object is found.
+    """
+    depth = 0
+    start = -1
+    in_string = escaped = False
+    for i, c in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = depth > 0
+        elif c == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif c == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text
+
+
+@lru_cache(maxsize=64)
+def _get_font(font_path, fontsize: int):
+    """Load a font once per (path, size); falls back to PIL's default font"""
+    try:
+        return ImageFont.truetype(font_path, fontsize) if font_path else ImageFont.load_default()
+    except Exception:
+        return ImageFont.load_default()
+
+
+def _render_text(content: str, font_path, fontsize: int, color) -> np.ndarray:
+    """Rasterize a text overlay into a padded RGBA array"""
+    font_obj = _get_font(font_path, fontsize)
+
+    # Use getbbox() instead of deprecated textsize()
+    left, top, right, bottom = font_obj.getbbox(content)
+    tw, th = right - left, bottom - top
+
+    # Create canvas with padding
+    img = Image.new("RGBA", (tw + 20, th + 20), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    # Draw text offset by the bounding box start to prevent clipping
+    draw.text((10 - left, 10 - top), content, font=font_obj, fill=color)
+    return np.array(img)
+
+
+# Per-thread scratch for the single-channel intermediate; edits may run on
+# several worker threads at once
+_gray_scratch = threading.local()
+
+
+def _grayscale_frame_cv2(im):
+    """Rec.601 grayscale of an RGB frame, kept as 3 channels.
+
+    OpenCV's fixed-point SIMD conversion replaces a float64 dot product plus
+    a dstack copy per frame. The intermediate plane is reused across frames;
+    the returned frame is always fresh since MoviePy may hold on to it.
+    """
+    shape = im.shape[:2]
+    gray = getattr(_gray_scratch, "buf", None)
+    if gray is None or gray.shape != shape:
+        gray = _gray_scratch.buf = np.empty(shape, dtype=np.uint8)
+    cv2.cvtColor(np.ascontiguousarray(im[..., :3]), cv2.COLOR_RGB2GRAY, dst=gray)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+
+
+def _grayscale_frame_numpy(im):
+    """Same conversion without OpenCV, in 8.8 fixed point like libjpeg-turbo.
+
+    (77*R + 150*G + 29*B + 128) >> 8 stays in uint16 (max 65408), so there is
+    no float temporary of the whole frame.
+    """
+    y = np.multiply(im[..., 0], 77, dtype=np.uint16)
+    y += np.multiply(im[..., 1], 150, dtype=np.uint16)
+    y += np.multiply(im[..., 2], 29, dtype=np.uint16)
+    y += 128
+    y >>= 8
+    out = np.empty(im.shape[:2] + (3,), dtype=np.uint8)
+    out[...] = y[..., None]
+    return out
+
+
+def _scale_audio(samples, gain: float):
+    """Apply `gain` in place, clipping so a boost can't wrap around when
+    MoviePy converts the samples to int16"""
+    np.multiply(samples, gain, out=samples)
+    np.clip(samples, -1.0, 1.0, out=samples)
+
+
+# OpenCV's hand-written SIMD when installed, plain NumPy otherwise
+_grayscale_frame = _grayscale_frame_cv2 if cv2 is not None else _grayscale_frame_numpy
+
+
+def _encoder_threads(settings) -> int:
+    return settings.encoder_threads or os.cpu_count() or 1
+
+
+def _unique_tag() -> str:
+    """Filename prefix that can't collide for files created in the same second"""
+    return f"{time.monotonic_ns()}_{uuid.uuid4().hex[:8]}"
+
+
+def _fuse_frame_ops(ops):
+    """Compose per-frame functions into a single MoviePy image transform"""
+    if len(ops) == 1:
+        return ops[0]
+
+    def fused(im):
+        for op in ops:
+            im = op(im)
+        return im
+    return fused
+
+
+def _copy_file_kernel(src, dest_path: str):
+    """Copy an open file to `dest_path` from its current position.
+
+    Uses copy_file_range(2) so the data never passes through userspace
+    (and can be reflinked on filesystems that support it); falls back to a
+    buffered copy where the syscall is unavailable.
+    """
+    src.flush()
+    start = src.tell()
+    with open(dest_path, "wb") as dst:
+        if hasattr(os, "copy_file_range"):
+            try:
+                while os.copy_file_range(src.fileno(), dst.fileno(), 1 << 30):
+                    pass
+                return
+            except OSError:
+                src.seek(start)
+                dst.seek(0)
+                dst.truncate()
+        shutil.copyfileobj(src, dst, UPLOAD_CHUNK_SIZE)
+
+
+def _sample_frames(video_path: str, output_dir: str, fps: float) -> List[str]:
+    """Write every `stride`-th frame of the video to `output_dir` as JPEG.
+
+    grab() only demuxes; retrieve() decodes, so skipped frames never pay
+    for decoding.
+    """
+    if cv2 is None:
+        raise RuntimeError("Frame extraction requires OpenCV (opencv-python)")
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {video_path}")
+    try:
+        src_fps = cap.get(cv2.CAP_PROP_FPS) or fps
+        stride = max(1, int(round(src_fps / fps)))
+        os.makedirs(output_dir, exist_ok=True)
+
+        frame_paths = []
+        index = 0
+        while cap.grab():
+            if index % stride == 0:
+                ok, frame = cap.retrieve()
+                if not ok:
+                    break
+                frame_path = os.path.join(output_dir, f"{index:08d}.jpg")
+                cv2.imwrite(frame_path, frame)
+                frame_paths.append(frame_path)
+            index += 1
+        return frame_paths
+    finally:
+        cap.release()
+
+
+def _parse_rate(rate: str) -> float:
+    """Parse an ffprobe frame rate such as "30000/1001" """
+    num, _, den = rate.partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+async def _ffprobe(video_path: str) -> Dict[str, Any]:
+    """Read the first video stream's header fields with one ffprobe call"""
+    proc = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,width,height,r_frame_rate,duration:format=duration",
+        "-print_format", "json",
+        video_path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {stderr.decode(errors='replace').strip()}")
+    return orjson.loads(out)
+
+
+def _drop_page_cache(f):
+    """Hint the kernel that an open file's cached pages won't be read again"""
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+
+async def _run_ffmpeg(args):
+    """Run ffmpeg without blocking the event loop; raise with its stderr on failure"""
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+
+
 class VideoService:
     def __init__(self):
-        self.processing_status = {}
         settings = get_settings()
+        # Fail before the encoder probe and index read, not after
         gemini_api_key = settings.gemini_api_key
         if not gemini_api_key:
             raise ValueError("GEMINI_API_KEY not configured.")
-        
+
+        # Bounded in LRU order so a long-running service doesn't grow without limit
+        self.processing_status: "OrderedDict[str, str]" = OrderedDict()
+        # One-shot events fired on the next status change of each video. Held
+        # weakly, so an event dies with the last progress socket waiting on it
+        # instead of piling up for ids whose status never changes.
+        self._status_events: "weakref.WeakValueDictionary[str, asyncio.Event]" = weakref.WeakValueDictionary()
+        self._max_statuses = settings.max_tracked_statuses
+        # Directories already created by this process (see _ensure_dir)
+        self._ensured_dirs: set = set()
+        # ENABLE_GPU=false pins encoding to libx264 and skips the probe
+        self._hw_codec = _detect_hw_encoder() if settings.enable_gpu else None
+        logger.info(f"Video encoder: {self._hw_codec or 'libx264'}")
+        # Uploaded video_id -> filename of its latest edited output
+        self.output_index: Dict[str, str] = self._load_output_index(settings.output_index_file)
+        # blake2b(prompt) -> parsed Gemini commands, in LRU order
+        self._instr_cache: "OrderedDict[bytes, Dict]" = OrderedDict()
+
         genai.configure(api_key=gemini_api_key)
         self.model = genai.GenerativeModel('gemini-2.5-flash')
 
+    @classmethod
+    async def create(cls) -> "VideoService":
+        """Build the service on a worker thread so startup doesn't block the event loop"""
+        return await asyncio.to_thread(cls)
+
+    @staticmethod
+    def _load_output_index(path: str) -> Dict[str, str]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            return index if isinstance(index, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable output index {path}: {e}")
+            return {}
+
+    def save_output_index(self):
+        """Persist the output index so downloads by video_id survive restarts"""
+        path = get_settings().output_index_file
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.output_index, f)
+        os.replace(tmp_path, path)
+
+    async def _ensure_dir(self, path: str):
+        """Create `path` once per process, off the event loop; later calls are a set lookup"""
+        if path not in self._ensured_dirs:
+            await asyncio.to_thread(os.makedirs, path, exist_ok=True)
+            self._ensured_dirs.add(path)
+
     async def save_upload(self, file: UploadFile, temp_dir: str) -> str:
-        os.makedirs(temp_dir, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        await self._ensure_dir(temp_dir)
         safe_filename = file.filename.replace(" ", "_")
-        file_path = os.path.join(temp_dir, f"{timestamp}_{safe_filename}")
+        file_path = os.path.join(temp_dir, f"{_unique_tag()}_{safe_filename}")
         
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        if getattr(file.file, "_rolled", False):
+            # Starlette already spooled the upload to a temp file: let the
+            # kernel copy it in a single worker-thread hop
+            await asyncio.to_thread(_copy_file_kernel, file.file, file_path)
+            # The spool file is deleted after the request; don't let its pages
+            # crowd the saved copy (which ffmpeg reads next) out of the cache
+            _drop_page_cache(file.file)
+        else:
+            # Small in-memory upload: stream it out in 1 MiB chunks
+            async with aiofiles.open(file_path, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await buffer.write(chunk)
         
         logger.info(f"Video saved: {file_path}")
         return file_path   
 
     async def _get_ai_instructions(self, user_prompt: str) -> Dict:
+        """Parse a prompt with Gemini, reusing the result for repeated prompts"""
+        commands = _keyword_parse(user_prompt)
+        if commands:
+            return commands
+
+        digest = hashlib.blake2b(user_prompt.encode()).digest()
+        cached = self._instr_cache.get(digest)
+        if cached is not None:
+            self._instr_cache.move_to_end(digest)
+            return dict(cached)
+
+        commands = await self._ask_gemini(user_prompt)
+        # Don't pin failed parses; the next identical prompt should retry
+        if commands:
+            self._instr_cache[digest] = commands
+            if len(self._instr_cache) > INSTRUCTION_CACHE_SIZE:
+                self._instr_cache.popitem(last=False)
+        return dict(commands)
+
+    async def _ask_gemini(self, user_prompt: str) -> Dict:
         system_prompt = """
         Map the user's request to a JSON object:
         - "trim_start": (float) seconds to cut from start.
@@ -63,54 +562,65 @@ class VideoService:
         """
         try:
             response = self.model.generate_content(f"{system_prompt}\nUser Request: {user_prompt}")
-            text = response.text.strip()
-            if "```" in text:
-                text = text.replace("```json", "").replace("```", "")
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                text = json_match.group(0)
-            return json.loads(text)
+            # The brace scan skips any ```json fences around the object, so no
+            # strip/replace passes are needed first
+            return orjson.loads(_extract_json(response.text))
         except Exception as e:
             logger.error(f"Gemini parsing failed: {e}")
             return {}
 
-    def _remove_audio_noise(self, audio_clip):
-        """Remove audio noise with reduced memory footprint using streaming/chunking"""
+    def _remove_audio_noise(self, audio_clip, gain: float = 1.0):
+        """Remove audio noise with reduced memory footprint using streaming/chunking.
+
+        `gain` is applied to the cleaned samples before they are returned.
+        """
         try:
             if not audio_clip: return None
             rate = int(getattr(audio_clip, "fps", 44100))
             settings = get_settings()
             chunk_duration = settings.audio_chunk_duration  # Configurable chunk size
             
-            duration = audio_clip.duration
-            num_chunks = int(np.ceil(duration / chunk_duration))
+            # Cleaned samples are written straight into one preallocated
+            # buffer instead of being concatenated (a second full copy) at the end
+            total = int(audio_clip.duration * rate)
+            full_clean = None
+            written = 0
+            noise_profile = None
             
-            cleaned_chunks = []
-            
-            for i in range(num_chunks):
-                start_time = i * chunk_duration
-                end_time = min((i + 1) * chunk_duration, duration)
-                
-                # Extract only this chunk
-                chunk_clip = audio_clip.subclipped(start_time, end_time) if hasattr(audio_clip, 'subclipped') else audio_clip.subclip(start_time, end_time)
-                audio_array = chunk_clip.to_soundarray(fps=rate)
+            # Decode the track front to back in one pass; iter_chunks walks
+            # the reader sequentially instead of seeking for every subclip
+            for audio_array in audio_clip.iter_chunks(chunk_duration=chunk_duration, fps=rate, logger=None):
+                if len(audio_array) == 0:
+                    continue
                 
-                # Reduce noise on chunk
-                if audio_array.ndim > 1:
-                    data = audio_array.T 
-                    reduced = nr.reduce_noise(y=data, sr=rate, stationary=True)
-                    clean = reduced.T 
-                else:
-                    clean = nr.reduce_noise(y=audio_array, sr=rate, stationary=True)
+                # Convert once to contiguous float32 (channels, samples): half the
+                # bytes of float64 and the layout the STFT wants, no transposes
+                data = np.ascontiguousarray(np.atleast_2d(audio_array.T), dtype=np.float32)
+                # Stationary noise: estimate the profile once from the first
+                # second instead of from every whole chunk
+                if noise_profile is None:
+                    noise_profile = data[:, :rate].copy()
+                clean = nr.reduce_noise(
+                    y=data, y_noise=noise_profile, sr=rate, stationary=True,
+                    n_fft=2048, hop_length=512, n_jobs=-1,  # channels in parallel
+                )
                 
-                cleaned_chunks.append(clean)
+                if full_clean is None:
+                    full_clean = np.empty((data.shape[0], total), dtype=np.float32)
+                n = min(clean.shape[-1], total - written)
+                full_clean[:, written:written + n] = clean[..., :n]
+                written += n
                 
                 # Free memory after processing chunk
-                del audio_array, chunk_clip
+                del audio_array, data, clean
             
-            # Concatenate cleaned chunks
-            full_clean = np.concatenate(cleaned_chunks, axis=0)
-            return AudioArrayClip(full_clean, fps=rate)
+            if full_clean is None:
+                return audio_clip
+            full_clean = full_clean[:, :written]
+            if gain != 1.0:
+                _scale_audio(full_clean, gain)
+            # AudioArrayClip wants (samples, channels)
+            return AudioArrayClip(full_clean.T, fps=rate)
         except Exception as e:
             logger.error(f"Noise reduction error: {e}")
             return audio_clip
@@ -121,6 +631,8 @@ class VideoService:
 
         text_clips = []
         duration = clip.duration
+        # Overlays repeating the same text/font/size/color share one raster
+        rendered: Dict[tuple, np.ndarray] = {}
 
         for t in texts:
             try:
@@ -140,70 +652,29 @@ class VideoService:
                 # 1. Try TextClip (Requires ImageMagick)
                 try:
                     txt_clip = TextClip(content, fontsize=fontsize, color=color, font=font_path) if font_path else TextClip(content, fontsize=fontsize, color=color)
-                    txt_clip = txt_clip.set_duration(dur).set_start(start).set_pos(position)
+                    txt_clip = getattr(txt_clip, _WITH_DURATION)(dur)
+                    txt_clip = getattr(txt_clip, _WITH_START)(start)
+                    txt_clip = getattr(txt_clip, _WITH_POSITION)(position)
                     text_clips.append(txt_clip)
                 
                 # 2. PIL Fallback (Modern Pillow 10+ compatible)
                 except Exception:
-                    from PIL import Image, ImageDraw, ImageFont
-                    
-                    try:
-                        font_obj = ImageFont.truetype(font_path, fontsize) if font_path else ImageFont.load_default()
-                    except:
-                        font_obj = ImageFont.load_default()
-
-                    # Use getbbox() instead of deprecated textsize()
-                    left, top, right, bottom = font_obj.getbbox(content)
-                    tw, th = right - left, bottom - top
-
-                    # Create canvas with padding
-                    img = Image.new("RGBA", (tw + 20, th + 20), (0, 0, 0, 0))
-                    draw = ImageDraw.Draw(img)
-                    # Draw text offset by the bounding box start to prevent clipping
-                    draw.text((10 - left, 10 - top), content, font=font_obj, fill=color)
-
-                    img_clip = ImageClip(np.array(img))
+                    key = (content, font_path, fontsize, color)
+                    if key not in rendered:
+                        rendered[key] = _render_text(content, font_path, fontsize, color)
+
+                    raster = rendered[key]
+                    ih, iw = raster.shape[:2]
+                    img_clip = ImageClip(raster)
                     
-                    # Set duration and start - handle both MoviePy v1 and v2
-                    if hasattr(img_clip, 'set_duration'):
-                        img_clip = img_clip.set_duration(dur).set_start(start)
-                    elif hasattr(img_clip, 'with_duration'):
-                        img_clip = img_clip.with_duration(dur).with_start(start)
-                    else:
-                        img_clip.duration = dur
-                        img_clip.start = start
+                    img_clip = getattr(img_clip, _WITH_DURATION)(dur)
+                    img_clip = getattr(img_clip, _WITH_START)(start)
                     
-                    # Manual Position Handling for ImageClip
-                    # Ensuring `pos` is a callable that returns numeric (x, y) coordinates
-                    def _safe_size(c, default=0):
-                        try:
-                            return getattr(c, 'w', None) or (c.size[0] if hasattr(c, 'size') else default)
-                        except Exception:
-                            return default
-
-                    iw = _safe_size(img_clip, 0)
-                    ih = _safe_size(img_clip, 0)
-
-                    if position == "center":
-                        pos = lambda t: ((clip.w - iw) / 2, (clip.h - ih) / 2)
-                    elif position == "top-left":
-                        pos = lambda t: (20, 20)
-                    elif position == "top-right":
-                        pos = lambda t: (max(0, clip.w - iw - 20), 20)
-                    elif position == "bottom-left":
-                        pos = lambda t: (20, max(0, clip.h - ih - 20))
-                    elif position == "bottom-right":
-                        pos = lambda t: (max(0, clip.w - iw - 20), max(0, clip.h - ih - 20))
-                    else:
-                        # default to center
-                        pos = lambda t: ((clip.w - iw) / 2, (clip.h - ih) / 2)
-
-                    # Prefer the native setter when available (it accepts strings or callables).
-                    if hasattr(img_clip, 'set_pos'):
-                        img_clip = img_clip.set_pos(pos)
-                    else:
-                        # assign a callable that returns numeric tuple to avoid MoviePy attempting to call strings
-                        img_clip.pos = pos
+                    # Overlays don't move, so resolve the anchor to a static
+                    # (x, y) once instead of a callable evaluated every frame.
+                    # Unknown positions default to center
+                    anchor = _TEXT_POSITIONS.get(position, _TEXT_POSITIONS["center"])
+                    img_clip = getattr(img_clip, _WITH_POSITION)(anchor(clip.w, clip.h, iw, ih))
                     
                     text_clips.append(img_clip)
 
@@ -215,91 +686,234 @@ class VideoService:
         # Composite layers
         result = CompositeVideoClip([clip] + text_clips)
         
-        # Set duration - handle both MoviePy v1 and v2
-        if hasattr(result, 'set_duration'):
-            return result.set_duration(clip.duration)
-        elif hasattr(result, 'with_duration'):
-            return result.with_duration(clip.duration)
-        else:
-            result.duration = clip.duration
-            return result
+        return getattr(result, _WITH_DURATION)(clip.duration)
 
     async def edit_video_by_instruction(self, video_path: str, instruction: str) -> Dict[str, Any]:
         video_id = os.path.basename(video_path)
-        self.processing_status[video_id] = "processing"
+        self._set_status(video_id, "processing")
         
         commands = await self._get_ai_instructions(instruction)
         
         try:
-            clip = VideoFileClip(video_path)
-            
-            # --- TRIMMING ---
-            if commands.get("trim_start") or commands.get("trim_end"):
-                try:
-                    s = float(commands.get("trim_start", 0))
-                    e = clip.duration - float(commands.get("trim_end", 0))
-                    clip = clip.subclipped(s, e) if hasattr(clip, "subclipped") else clip.subclip(s, e)
-                except (ValueError, TypeError):
-                    logger.warning(f"Invalid trim values: start={commands.get('trim_start')}, end={commands.get('trim_end')}")
+            # --- OUTPUT ---
+            output_dir = os.path.dirname(video_path).replace("temp_videos", "output_videos")
+            await self._ensure_dir(output_dir)
+            output_filename = f"edited_{_unique_tag()}_{video_id}.mp4"
+            output_path = os.path.join(output_dir, output_filename)
 
-            # --- AUDIO ---
-            if commands.get("remove_noise") and clip.audio:
-                clip.audio = self._remove_audio_noise(clip.audio)
+            # Text overlays need MoviePy's Python frame pipeline (run on a worker
+            # thread so it doesn't stall the event loop); everything else runs
+            # as a single native ffmpeg pass
+            if commands.get("texts"):
+                await asyncio.to_thread(self._edit_with_moviepy, video_path, output_path, commands)
+            else:
+                await self._edit_with_ffmpeg(video_path, output_path, commands)
 
-            if commands.get("volume_boost", 1.0) != 1.0:
-                try:
-                    boost = float(commands.get("volume_boost", 1.0))
-                    if boost != 1.0 and clip.audio:
-                        if hasattr(clip.audio, "multiply_volume"):
-                            clip.audio = clip.audio.multiply_volume(boost)
-                        else:
-                            clip.audio = clip.audio.volumex(boost)
-                except (ValueError, TypeError):
-                    logger.warning(f"Invalid volume_boost value: {commands.get('volume_boost')}")
-
-            # --- VISUALS ---
-            if commands.get("grayscale"):
-                if vfx and hasattr(vfx, 'blackwhite'):
-                    clip = clip.fx(vfx.blackwhite)
-                else:
-                    clip = clip.image_transform(lambda im: np.dstack([np.dot(im[...,:3], [0.299, 0.587, 0.114])] * 3).astype('uint8'))
-            
-            if commands.get("speed", 1.0) != 1.0:
-                try:
-                    speed_val = float(commands.get("speed", 1.0))
-                    if speed_val != 1.0 and vfx and hasattr(vfx, 'speedx'):
-                        clip = clip.fx(vfx.speedx, speed_val)
-                except (ValueError, TypeError):
-                    logger.warning(f"Invalid speed value: {commands.get('speed')}")
+            self.output_index[video_id] = output_filename
+            self._set_status(video_id, "completed")
+            return {"status": "success", "output_path": output_path, "operations": commands}
 
-            # --- TEXT OVERLAYS ---
-            if commands.get("texts"):
-                clip = self._apply_texts_to_clip(clip, commands.get("texts"))
+        except Exception as e:
+            logger.exception("Editing Failed")
+            self._set_status(video_id, "failed")
+            return {"status": "error", "message": str(e)}
+
+    async def _edit_with_ffmpeg(self, video_path: str, output_path: str, commands: Dict[str, Any]):
+        """Apply trim/denoise/volume/grayscale/speed as one ffmpeg filter graph.
+
+        Frames stay in ffmpeg's native format the whole way, so there is no
+        per-frame Python callback and only one decode and one encode.
+        """
+        infos = await asyncio.to_thread(ffmpeg_parse_infos, video_path)
+        seek_args, video_filters, audio_filters = _build_filter_graph(
+            commands, infos["duration"], infos.get("video_fps")
+        )
+
+        settings = get_settings()
+        args = [*seek_args, "-i", video_path, "-map", "0:v:0", "-map", "0:a?"]
+        if audio_filters and infos.get("audio_found"):
+            args += ["-af", ",".join(audio_filters)]
+        # A frame-accurate trim needs a re-encode; a stream copy would cut on
+        # keyframes. Sources whose codec MP4 can't hold (e.g. FLV's flv1) too.
+        copy_video = infos.get("video_codec_name") in _MP4_VIDEO_CODECS
+        if video_filters or seek_args or not copy_video:
+            codec, preset, rate_args = self._encoder(settings.video_preset, settings.video_crf)
+            if video_filters:
+                args += ["-vf", ",".join(video_filters)]
+            args += ["-c:v", codec, "-preset", preset, *rate_args]
+            if codec == "libx264":
+                args += ["-b:v", settings.video_bitrate]
+            args += ["-pix_fmt", "yuv420p", "-threads", str(_encoder_threads(settings))]
+        else:
+            # Audio-only edit (volume/denoise): pass the video bitstream through
+            args += ["-c:v", "copy"]
+        args += [
+            "-c:a", "aac",
+            "-movflags", "+faststart",
+            output_path,
+        ]
+        await _run_ffmpeg(args)
+
+    def _edit_with_moviepy(self, video_path: str, output_path: str, commands: Dict[str, Any]):
+        clip = VideoFileClip(video_path)
+        
+        # --- TRIMMING ---
+        if commands.get("trim_start") or commands.get("trim_end"):
+            try:
+                s = float(commands.get("trim_start", 0))
+                e = clip.duration - float(commands.get("trim_end", 0))
+                clip = getattr(clip, _SUBCLIP)(s, e)
+            except (ValueError, TypeError):
+                logger.warning(f"Invalid trim values: start={commands.get('trim_start')}, end={commands.get('trim_end')}")
+
+        # --- AUDIO ---
+        boost = _float_command(commands, "volume_boost", 1.0)
+        if commands.get("remove_noise") and clip.audio:
+            # The denoised samples are already decoded: apply the gain to them
+            # rather than filtering the track again at mux time
+            cleaned = self._remove_audio_noise(clip.audio, gain=boost)
+            if cleaned is not clip.audio:  # on failure the original track comes back
+                boost = 1.0
+            clip.audio = cleaned
+
+        # Otherwise volume is applied by ffmpeg while muxing instead of
+        # re-rendering the samples through a Python-level volume effect
+        audio_filters = []
+        if boost != 1.0 and clip.audio:
+            audio_filters.append(f"volume={boost}")
+
+        # --- VISUALS ---
+        # Per-pixel ops share one frame callback instead of one fx layer each
+        pixel_ops = []
+        if commands.get("grayscale"):
+            pixel_ops.append(_grayscale_frame)
+        if pixel_ops:
+            clip = getattr(clip, _IMAGE_TRANSFORM)(_fuse_frame_ops(pixel_ops))
+        
+        speed_val = _float_command(commands, "speed", 1.0)
+        if speed_val > 0 and speed_val != 1.0 and _FX_SPEED:
+            clip = _FX_SPEED(clip, speed_val)
+
+        # --- TEXT OVERLAYS ---
+        if commands.get("texts"):
+            clip = self._apply_texts_to_clip(clip, commands.get("texts"))
+
+        # Optimize for low RAM usage: use lower bitrate, preset, and ffmpeg parameters
+        settings = get_settings()
+        codec, preset, rate_args = self._encoder(settings.video_preset, settings.video_crf)
+        clip.write_videofile(
+            output_path, 
+            codec=codec,
+            audio_codec="aac",
+            preset=preset,  # faster encoding, less RAM
+            # Reduce bitrate to lower RAM usage (hardware encoders use constant quality)
+            bitrate=settings.video_bitrate if codec == "libx264" else None,
+            threads=_encoder_threads(settings),
+            logger=None,  # the per-frame progress bar costs a Python callback per frame
+            ffmpeg_params=[
+                *rate_args,  # Quality setting
+                "-movflags", "+faststart",  # moov atom up front for streaming downloads
+                # MoviePy muxes its temp audio with -acodec copy; filtering needs a re-encode
+                *(["-af", ",".join(audio_filters), "-c:a", "aac"] if audio_filters else []),
+            ]
+        )
+        
+        clip.close()
+
+    async def enhance_video(self, video_path: str, enhancement_type, enhancement_settings) -> Dict[str, Any]:
+        """Apply a single enhancement in one ffmpeg pass.
+
+        Decoding may use hardware acceleration; the video is re-encoded with
+        low-latency x264 settings and the audio stream is copied untouched.
+        """
+        video_id = os.path.basename(video_path)
+        kind = getattr(enhancement_type, "value", enhancement_type)
+        self._set_status(video_id, "processing")
+
+        try:
+            video_filter = _ENHANCEMENT_FILTERS[kind](enhancement_settings.intensity)
 
-            # --- OUTPUT ---
             output_dir = os.path.dirname(video_path).replace("temp_videos", "output_videos")
-            os.makedirs(output_dir, exist_ok=True)
-            output_filename = f"edited_{int(datetime.now().timestamp())}_{video_id}.mp4"
+            await self._ensure_dir(output_dir)
+            output_filename = f"enhanced_{kind}_{_unique_tag()}_{video_id}.mp4"
             output_path = os.path.join(output_dir, output_filename)
 
-            # Optimize for low RAM usage: use lower bitrate, preset, and ffmpeg parameters
             settings = get_settings()
-            clip.write_videofile(
-                output_path, 
-                codec="libx264",
-                audio_codec="aac",
-                preset=settings.video_preset,  # faster encoding, less RAM
-                bitrate=settings.video_bitrate,  # Reduce bitrate to lower RAM usage
-                ffmpeg_params=["-crf", str(settings.video_crf)]  # Quality setting
-            )
-            
-            clip.close()
-            self.processing_status[video_id] = "completed"
-            return {"status": "success", "output_path": output_path, "operations": commands}
+            crf = 18 if enhancement_settings.preserve_quality else settings.video_crf
+            codec, preset, rate_args = self._encoder("ultrafast", crf)
+            video_args = ["-c:v", codec, "-preset", preset, *rate_args]
+            if codec == "libx264":
+                video_args += ["-tune", "zerolatency"]
+            await _run_ffmpeg([
+                "-hwaccel", "auto",
+                "-i", video_path,
+                "-map", "0:v:0", "-map", "0:a?",
+                "-vf", video_filter,
+                *video_args,
+                "-threads", str(_encoder_threads(settings)),
+                "-c:a", "copy",
+                "-movflags", "+faststart",
+                output_path,
+            ])
+
+            self.output_index[video_id] = output_filename
+            self._set_status(video_id, "completed")
+            return {"status": "success", "output_path": output_path, "enhancement_type": kind}
 
         except Exception as e:
-            logger.exception("Editing Failed")
+            logger.exception("Enhancement Failed")
+            self._set_status(video_id, "failed")
             return {"status": "error", "message": str(e)}
 
+    async def extract_frames(self, video_path: str, output_dir: str, fps: float = 1.0) -> List[str]:
+        """Sample frames at roughly `fps` per second; returns the written JPEG paths"""
+        if fps <= 0:
+            raise ValueError("fps must be positive")
+        return await asyncio.to_thread(_sample_frames, video_path, output_dir, fps)
+
+    async def get_video_metadata(self, video_path: str) -> VideoMetadata:
+        """Probe container/stream headers without decoding any frames"""
+        info = await _ffprobe(video_path)
+        streams = info.get("streams") or []
+        if not streams:
+            raise ValueError(f"No video stream in {video_path}")
+        stream = streams[0]
+        # Some containers only report the duration at the format level
+        duration = stream.get("duration") or info.get("format", {}).get("duration") or 0
+        video_id = os.path.basename(video_path)
+        size = (await asyncio.to_thread(os.stat, video_path)).st_size
+
+        return VideoMetadata(
+            video_id=video_id,
+            filename=video_id,
+            duration=float(duration),
+            width=int(stream.get("width", 0)),
+            height=int(stream.get("height", 0)),
+            fps=_parse_rate(stream.get("r_frame_rate", "0/1")),
+            file_size_mb=round(size / (1024 * 1024), 2),
+            codec=stream.get("codec_name", "unknown"),
+            status=self.processing_status.get(video_id, "unknown"),
+        )
+
+    def _encoder(self, x264_preset: str, crf: int) -> Tuple[str, str, List[str]]:
+        """(codec, preset, rate-control args): the detected hardware encoder, else x264"""
+        if self._hw_codec:
+            preset, rate_args = _HW_ENCODERS[self._hw_codec]
+            return self._hw_codec, preset, rate_args(crf)
+        return "libx264", x264_preset, ["-crf", str(crf)]
+
+    def _set_status(self, video_id: str, status: str):
+        self.processing_status[video_id] = status
+        self.processing_status.move_to_end(video_id)
+        while len(self.processing_status) > self._max_statuses:
+            self.processing_status.popitem(last=False)
+        event = self._status_events.pop(video_id, None)
+        if event is not None:
+            event.set()
+
+    def status_changed(self, video_id: str) -> asyncio.Event:
+        """Event that is set on the next status change of `video_id`"""
+        return self._status_events.setdefault(video_id, asyncio.Event())
+
     async def get_status(self, video_id: str) -> str:
         return self.processing_status.get(video_id, "unknown")
\ No newline at end of file
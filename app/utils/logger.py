@@ -3,12 +3,25 @@
 import logging
 import logging.handlers
 import os
+import queue
 from pathlib import Path
+from typing import Dict, Tuple
+
+# Logger name -> (listener doing the actual (blocking) writes on its own
+# thread, queue handler feeding it)
+_listeners: Dict[str, Tuple[logging.handlers.QueueListener, logging.handlers.QueueHandler]] = {}
 
 
 def setup_logger(name: str, log_dir: str = "./logs", level: str = "INFO") -> logging.Logger:
-    """Setup logger with file and console handlers"""
-    
+    """Setup logger with file and console handlers.
+
+    Records are only enqueued on the calling thread; a background listener
+    formats and writes them, so request handlers never wait on disk I/O or
+    log rotation. Call `stop_logger` at shutdown to flush.
+    """
+    # Calling again replaces the previous listener instead of leaking its thread
+    stop_logger(name)
+
     # Create logs directory if it doesn't exist
     Path(log_dir).mkdir(parents=True, exist_ok=True)
     
@@ -33,7 +46,28 @@ def setup_logger(name: str, log_dir: str = "./logs", level: str = "INFO") -> log
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
     
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    _listeners[name] = (listener, queue_handler)
+
+    logger.addHandler(queue_handler)
     
     return logger
+
+
+def stop_logger(name: str) -> None:
+    """Flush pending records and stop the background writer of `name`.
+
+    The queue handler is detached too, so later records aren't enqueued
+    where nothing drains them.
+    """
+    entry = _listeners.pop(name, None)
+    if entry is None:
+        return
+    listener, queue_handler = entry
+    logging.getLogger(name).removeHandler(queue_handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -1,27 +1,34 @@
 """Input validation utilities"""
 
-from typing import List
+from typing import List, Optional
 import os
 
 
 def validate_video_file(file_path: str, allowed_extensions: List[str]) -> bool:
     """Validate if file is a supported video format"""
-    if not os.path.exists(file_path):
+    # Check the extension first so unsupported files never cost a syscall
+    if get_file_extension(file_path) not in allowed_extensions:
         return False
-    
-    ext = os.path.splitext(file_path)[1].lower().strip(".")
-    return ext in allowed_extensions
+    return _stat(file_path) is not None
 
 
 def validate_file_size(file_path: str, max_size_mb: int) -> bool:
     """Validate file size"""
-    if not os.path.exists(file_path):
+    st = _stat(file_path)
+    if st is None:
         return False
     
-    file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-    return file_size_mb <= max_size_mb
+    return st.st_size <= max_size_mb * 1024 * 1024
 
 
 def get_file_extension(file_path: str) -> str:
     """Get file extension"""
     return os.path.splitext(file_path)[1].lower().strip(".")
+
+
+def _stat(file_path: str) -> Optional[os.stat_result]:
+    """One stat() call standing in for exists() + getsize()"""
+    try:
+        return os.stat(file_path)
+    except OSError:
+        return None
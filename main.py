@@ -1,4 +1,5 @@
 import os
+import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -13,13 +14,21 @@ import logging
 
 from app.config import get_settings
 from app.api.routes import router
-from app.utils.logger import setup_logger
+from app.models.schemas import FeaturesResponse, ServiceInfoResponse
+from app.services.instruction_service import close_gemini_client
+from app.services.video_service import VideoService
+from app.utils.logger import setup_logger, stop_logger
 
 logger = setup_logger("filmy-ai", level="INFO")
 logging.info(f"🎬 Filmy-AI started - If useful, please star: https://github.com/Programmer-Develops/filmy-ai")
 
 FIRST_RUN_FILE = ".first_run"
-if not os.path.exists(FIRST_RUN_FILE):
+
+
+def show_first_run_banner():
+    """Print the welcome banner on the very first start (set FILMY_NO_BANNER=1 to skip)"""
+    if os.environ.get("FILMY_NO_BANNER") == "1" or os.path.exists(FIRST_RUN_FILE):
+        return
     print("\n" + "="*50)
     print("🎬 Thanks for trying Filmy-AI!")
     print("⭐ If this helps your project, consider starring:")
@@ -27,12 +36,15 @@ if not os.path.exists(FIRST_RUN_FILE):
     print("="*50 + "\n")
     with open(FIRST_RUN_FILE, 'w') as f:
         f.write("1")
-        
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application startup and shutdown events"""
     # Startup
     logger.info("Starting Filmy AI API...")
+    # Once per server start rather than on every import (e.g. reloader respawns)
+    show_first_run_banner()
     settings = get_settings()
     
     # Create necessary directories
@@ -44,11 +56,22 @@ async def lifespan(app: FastAPI):
     ]:
         os.makedirs(dir_path, exist_ok=True)
         logger.info(f"Directory ready: {dir_path}")
+
+    # One VideoService per process, shared by all requests via app.state
+    try:
+        app.state.video_service = await VideoService.create()
+    except ValueError as e:
+        app.state.video_service = None
+        logger.warning(f"VideoService not initialised at startup: {e}")
     
     yield
     
     # Shutdown
     logger.info("Shutting down Filmy AI API...")
+    await close_gemini_client()
+    if app.state.video_service is not None:
+        await asyncio.to_thread(app.state.video_service.save_output_index)
+    stop_logger("filmy-ai")
 
 
 # Create FastAPI app
@@ -62,17 +85,13 @@ app = FastAPI(
 
 # --- CORS CONFIGURATION (FIXED) ---
 # When allow_credentials=True, you CANNOT use ["*"]. 
-# You must list the specific origins that need access.
-origins = [
-    "http://127.0.0.1:5500",      # VS Code Live Server
-    "http://localhost:5500",      # Alternative localhost
-    "https://filmy-ai.onrender.com", # Production domain
-    "*"
-]
+# Local dev servers on any port (e.g. VS Code Live Server on 5500) plus the
+# production domain; compiled once by Starlette.
+ORIGIN_REGEX = r"https?://(localhost|127\.0\.0\.1)(:\d+)?|https://filmy-ai\.onrender\.com"
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=origins, 
+    allow_origin_regex=ORIGIN_REGEX,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -83,7 +102,7 @@ app.add_middleware(
 app.include_router(router)
 
 
-@app.get("/")
+@app.get("/", response_model=ServiceInfoResponse)
 async def root():
     """Root endpoint"""
     return {
@@ -100,27 +119,33 @@ async def favicon():
     return Response(status_code=204)
 # -------------------
 
-@app.get("/api/v1/features")
+# Feature lists never change while the process runs: build them once
+VIDEO_ENHANCEMENTS = (
+    "upscale",
+    "denoise",
+    "color_correction",
+    "stabilization",
+    "super_resolution",
+    "motion_blur_removal"
+)
+EDITING_OPERATIONS = (
+    "trim",
+    "crop",
+    "rotate",
+    "resize",
+    "speed_adjust",
+    "brightness_contrast"
+)
+SUPPORTED_FORMATS = settings.supported_formats_list
+
+
+@app.get("/api/v1/features", response_model=FeaturesResponse)
 async def get_features():
     """Get available features"""
     return {
-        "video_enhancements": [
-            "upscale",
-            "denoise",
-            "color_correction",
-            "stabilization",
-            "super_resolution",
-            "motion_blur_removal"
-        ],
-        "editing_operations": [
-            "trim",
-            "crop",
-            "rotate",
-            "resize",
-            "speed_adjust",
-            "brightness_contrast"
-        ],
-        "supported_formats": settings.supported_formats.split(",")
+        "video_enhancements": VIDEO_ENHANCEMENTS,
+        "editing_operations": EDITING_OPERATIONS,
+        "supported_formats": SUPPORTED_FORMATS
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,36 @@
+import pytest
+
+from app.services.video_service import _keyword_parse
+
+
+@pytest.mark.parametrize("prompt, expected", [
+    ("make it black and white", {"grayscale": True}),
+    ("Please convert the video to grayscale.", {"grayscale": True}),
+    ("turn this clip into b&w", {"grayscale": True}),
+    ("apply a monochrome filter", {"grayscale": True}),
+    ("remove noise", {"remove_noise": True}),
+    ("remove background noise", {"remove_noise": True}),
+    ("reduce the audio noise", {"remove_noise": True}),
+    ("remove noise from the video", {"remove_noise": True}),
+    ("denoise the clip", {"remove_noise": True}),
+])
+def test_simple_prompts_short_circuit(prompt, expected):
+    assert _keyword_parse(prompt) == expected
+
+
+@pytest.mark.parametrize("prompt", [
+    # Negated forms must not apply the effect they name
+    "remove grayscale",
+    "remove the black and white filter",
+    "reduce grayscale",
+    "turn off the black and white filter",
+    "make it not black and white",
+    # Mixed or unknown requests go to the model
+    "make noise",
+    "remove noise and make it black and white",
+    "make it black and white and trim the first 5 seconds",
+    "speed it up",
+    "grayscale",
+])
+def test_other_prompts_need_the_model(prompt):
+    assert _keyword_parse(prompt) == {}